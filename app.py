@@ -4,23 +4,47 @@
 # interactive SPA dashboard and the backend API for NLP analysis.
 
 import os
+import glob
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask.sessions import SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, bindparam
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 import nltk
 import spacy
-from transformers import pipeline
-import re
+import numpy as np
+import torch
+from transformers import pipeline, AutoTokenizer
+from cachetools import LRUCache, TTLCache
+from filelock import FileLock
 
 # --- Configuration ---
 
 # Initialize Flask App
 app = Flask(__name__)
 
-# Secret key for session management
-app.config['SECRET_KEY'] = 'your_super_secret_key_change_this'
+# Secret key for session management, read from the environment in deployments
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+if not app.config['SECRET_KEY']:
+    print("SECRET_KEY not set, using the insecure development key.")
+    app.config['SECRET_KEY'] = 'your_super_secret_key_change_this'
+
+# Sign session cookies with HMAC-blake2b instead of Flask's default HMAC-SHA1.
+class Blake2bSessionInterface(SecureCookieSessionInterface):
+    digest_method = staticmethod(hashlib.blake2b)
+
+app.session_interface = Blake2bSessionInterface()
 
 # Database configuration (SQLite)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
@@ -34,18 +58,139 @@ try:
 except nltk.downloader.DownloadError:
     nltk.download('punkt')
 
-# Load spaCy model for Named Entity Recognition (NER)
-try:
-    nlp_ner = spacy.load("en_core_web_sm")
-except OSError:
-    print("Spacy model 'en_core_web_sm' not found.")
-    print("Please run: python -m spacy download en_core_web_sm")
-    nlp_ner = None
+# Load spaCy model for Named Entity Recognition (NER).
+# Only the entity recognizer is used, so the other pipeline components are disabled.
+# The shared tok2vec only feeds the tagger and parser; ner has its own embedding layer.
+def load_ner_model():
+    """Loads the spaCy NER model, or returns None if it is not installed."""
+    try:
+        return spacy.load("en_core_web_sm", disable=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer"])
+    except OSError:
+        print("Spacy model 'en_core_web_sm' not found.")
+        print("Please run: python -m spacy download en_core_web_sm")
+        return None
+
+# Load Hugging Face pipeline for Sentiment Analysis.
+# With a CUDA GPU the PyTorch model runs on it in fp16. On CPU the model is exported
+# to ONNX and quantized to int8 once, then served through ONNX Runtime, falling back
+# to the PyTorch checkpoint if optimum is not installed.
+SENTIMENT_MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+SENTIMENT_ONNX_DIR = os.path.join("models", "distilbert-sst2-int8")
+SENTIMENT_ONNX_FILE = "model_quantized.onnx"
+# Everything ORTModelForSequenceClassification and AutoTokenizer need to load the export.
+SENTIMENT_ONNX_REQUIRED_FILES = (SENTIMENT_ONNX_FILE, "config.json", "tokenizer_config.json")
+# Articles are scored in batches; sorting by length keeps padding within a batch small.
+SENTIMENT_BATCH_SIZE = 16
+
+def compile_sentiment_pipeline(sentiment_pipe):
+    """Wraps the pipeline's PyTorch model with torch.compile and warms it up."""
+    original_model = sentiment_pipe.model
+    # If compiling a new input shape fails later on, run that call eagerly instead of raising.
+    torch._dynamo.config.suppress_errors = True
+    try:
+        # Every batch pads to a different length, so compile for dynamic shapes. The default
+        # mode avoids CUDA graphs, which would record a new graph for each shape.
+        sentiment_pipe.model = torch.compile(original_model, dynamic=True)
+        # Compilation is lazy; trigger it now with the shapes real requests use: a full batch
+        # of short texts, a full batch truncated to 512 tokens, and a partial last batch.
+        for warmup_texts in (["warmup"] * SENTIMENT_BATCH_SIZE,
+                             ["warmup " * 600] * SENTIMENT_BATCH_SIZE,
+                             ["warmup"] * 3):
+            sentiment_pipe(warmup_texts, batch_size=SENTIMENT_BATCH_SIZE, truncation=True, max_length=512)
+    except Exception as e:
+        print(f"torch.compile unavailable, using the eager model: {e}")
+        sentiment_pipe.model = original_model
+    return sentiment_pipe
+
+def sentiment_onnx_exported():
+    """Returns True if a complete quantized ONNX export is present."""
+    return all(os.path.exists(os.path.join(SENTIMENT_ONNX_DIR, name)) for name in SENTIMENT_ONNX_REQUIRED_FILES)
+
+def export_sentiment_onnx():
+    """Exports and quantizes the sentiment model into SENTIMENT_ONNX_DIR, once across workers."""
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    models_dir = os.path.dirname(SENTIMENT_ONNX_DIR)
+    os.makedirs(models_dir, exist_ok=True)
+    with FileLock(SENTIMENT_ONNX_DIR + ".lock"):
+        # Another worker may have finished the export while this one waited for the lock.
+        if sentiment_onnx_exported():
+            return
+        print("Exporting Sentiment Analysis model to quantized ONNX...")
+        # Holding the lock means no export is in progress, so any temp dirs left over
+        # are from a killed process and can be removed.
+        tmp_prefix = "." + os.path.basename(SENTIMENT_ONNX_DIR) + "-"
+        for stale_dir in glob.glob(os.path.join(models_dir, tmp_prefix + "*")):
+            shutil.rmtree(stale_dir, ignore_errors=True)
+        # Build the export in a temp dir and move it into place, so the target
+        # directory is either absent or complete.
+        tmp_dir = tempfile.mkdtemp(prefix=tmp_prefix, dir=models_dir)
+        try:
+            onnx_model = ORTModelForSequenceClassification.from_pretrained(SENTIMENT_MODEL_NAME, export=True)
+            quantizer = ORTQuantizer.from_pretrained(onnx_model)
+            quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=quantization_config)
+            onnx_model.config.save_pretrained(tmp_dir)
+            AutoTokenizer.from_pretrained(SENTIMENT_MODEL_NAME).save_pretrained(tmp_dir)
+            # Clear out an incomplete directory left behind by an older, crashed export.
+            shutil.rmtree(SENTIMENT_ONNX_DIR, ignore_errors=True)
+            os.replace(tmp_dir, SENTIMENT_ONNX_DIR)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+def load_sentiment_pipeline():
+    """Builds the sentiment pipeline, preferring the GPU, then the quantized ONNX model."""
+    if torch.cuda.is_available():
+        print("CUDA available, running the Sentiment Analysis model on GPU in fp16.")
+        return compile_sentiment_pipeline(
+            pipeline("sentiment-analysis", model=SENTIMENT_MODEL_NAME, device=0, torch_dtype=torch.float16))
 
-# Load Hugging Face pipeline for Sentiment Analysis
-print("Loading Sentiment Analysis model...")
-sentiment_pipeline = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
-print("Sentiment Analysis model loaded.")
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError:
+        print("optimum[onnxruntime] not installed, using the PyTorch model.")
+        return compile_sentiment_pipeline(pipeline("sentiment-analysis", model=SENTIMENT_MODEL_NAME))
+
+    if not sentiment_onnx_exported():
+        export_sentiment_onnx()
+
+    model = ORTModelForSequenceClassification.from_pretrained(SENTIMENT_ONNX_DIR, file_name=SENTIMENT_ONNX_FILE)
+    tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_ONNX_DIR)
+    return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+
+# Models are loaded in a background thread so the app can finish booting meanwhile.
+# Code that uses them must call _models_ready.wait() first. A failed load is recorded
+# in _model_load_error and retried every MODEL_LOAD_RETRY_SECONDS.
+nlp_ner = None
+sentiment_pipeline = None
+_model_load_error = None
+_models_ready = threading.Event()
+MODEL_LOAD_RETRY_SECONDS = 30
+
+class ModelsUnavailableError(RuntimeError):
+    """Raised when analysis is requested but the NLP models failed to load."""
+
+def _load_models():
+    global nlp_ner, sentiment_pipeline, _model_load_error
+    while True:
+        try:
+            nlp_ner = load_ner_model()
+            print("Loading Sentiment Analysis model...")
+            sentiment_pipeline = load_sentiment_pipeline()
+            print("Sentiment Analysis model loaded.")
+            _model_load_error = None
+            _models_ready.set()
+            return
+        except Exception as e:
+            _model_load_error = e
+            print(f"Loading NLP models failed, retrying in {MODEL_LOAD_RETRY_SECONDS}s: {e!r}")
+            # Release waiting requests so they report the failure instead of hanging.
+            _models_ready.set()
+            time.sleep(MODEL_LOAD_RETRY_SECONDS)
+
+threading.Thread(target=_load_models, name="model-loader", daemon=True).start()
 
 # --- Database and Login Manager Setup ---
 
@@ -54,19 +199,41 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login' # Redirect here if not logged in
 
+# Password hashing: argon2id with the OWASP-recommended minimum cost.
+_PH = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
 # User Model
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(100), unique=True, nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
     language = db.Column(db.String(10), default='English')
     interests = db.Column(db.String(200), default='Technology,Economy')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = _PH.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Legacy werkzeug hashes are verified once, then upgraded to argon2.
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        try:
+            _PH.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if _PH.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
+
+# Built once so SQLAlchemy's compiled statement cache is reused on every lookup.
+_LOGIN_STMT = select(User).where(User.email == bindparam("email"))
+
+def get_user_by_email(email):
+    """Returns the User with the given email, or None."""
+    return db.session.execute(_LOGIN_STMT, {"email": email}).scalars().first()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -83,8 +250,10 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('interactive_dashboard'))
     if request.method == 'POST':
-        user = User.query.filter_by(email=request.form.get('email')).first()
+        user = get_user_by_email(request.form.get('email'))
         if user and user.check_password(request.form.get('password')):
+            # Persist the password hash if check_password upgraded it.
+            db.session.commit()
             login_user(user)
             return redirect(url_for('interactive_dashboard'))
         flash('Invalid email or password.', 'danger')
@@ -96,7 +265,7 @@ def register():
         return redirect(url_for('interactive_dashboard'))
     if request.method == 'POST':
         email = request.form.get('email')
-        if User.query.filter_by(email=email).first():
+        if get_user_by_email(email):
             flash('Email address already registered.', 'warning')
             return redirect(url_for('register'))
         new_user = User(email=email)
@@ -135,72 +304,184 @@ def interactive_dashboard():
 
 # --- API Endpoint for NLP Analysis ---
 
-def perform_nlp_analysis(text):
-    """Helper function to perform sentiment and NER analysis."""
+def analyze_sentiments(texts):
+    """Helper function to run sentiment analysis over a batch of texts in one pipeline call."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
     try:
-        sentiment_result = sentiment_pipeline(text[:512])[0]
-        if sentiment_result['score'] < 0.95:
-            sentiment_result['label'] = 'NEUTRAL'
+        sorted_results = sentiment_pipeline(
+            [texts[i] for i in order],
+            batch_size=SENTIMENT_BATCH_SIZE,
+            truncation=True,
+            max_length=512,
+        )
     except Exception:
-        sentiment_result = {'label': 'UNKNOWN', 'score': 0.0}
+        return [{'label': 'UNKNOWN', 'score': 0.0} for _ in texts]
 
-    entities = {"PERSON": [], "ORG": [], "GPE": []}
-    if nlp_ner:
-        doc = nlp_ner(text)
+    # Low-confidence predictions are reported as NEUTRAL, thresholded over the whole batch.
+    scores = np.fromiter((r['score'] for r in sorted_results), dtype=np.float64, count=len(order))
+    labels = np.array([r['label'] for r in sorted_results], dtype=object)
+    labels[scores < 0.95] = 'NEUTRAL'
+
+    results = [None] * len(texts)
+    for i, label, sentiment_result in zip(order, labels, sorted_results):
+        results[i] = {'label': label, 'score': sentiment_result['score']}
+    return results
+
+# Number of documents spaCy processes per batch in nlp_ner.pipe().
+NER_BATCH_SIZE = 32
+
+# Entity types reported to the dashboard, in response order.
+_ENTITY_LABELS = ("PERSON", "ORG", "GPE")
+
+# Profile language -> News API language code (anything else uses English).
+_LANG_MAP = {"Hindi": "hi"}
+
+def extract_entities(doc):
+    """Helper function to extract named entities from a pre-parsed spaCy Doc."""
+    labels = []
+    texts = []
+    if doc is not None:
         for ent in doc.ents:
-            if ent.label_ in entities:
-                entities[ent.label_].append(ent.text)
-        for key in entities:
-            entities[key] = list(set(entities[key]))
-            
-    return {'sentiment': sentiment_result, 'entities': entities}
+            if ent.label_ in _ENTITY_LABELS:
+                labels.append(ent.label_)
+                texts.append(ent.text)
+
+    # dict.fromkeys dedups in C and keeps first-seen order, unlike list(set(...)).
+    entities = {
+        label: list(dict.fromkeys(text for ent_label, text in zip(labels, texts) if ent_label == label))
+        for label in _ENTITY_LABELS
+    }
+    return entities
+
+# In-process LRU cache of analysis results, keyed by a hash of the article text.
+# Duplicate articles and repeated polling of the same feed skip the models entirely.
+_analysis_cache = LRUCache(maxsize=4096)
+_analysis_cache_lock = threading.Lock()
+
+def _analysis_key(text):
+    """Returns the cache key for an article text."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def analyze_texts(texts):
+    """Helper to run sentiment and NER analysis on a list of texts, using the cache where possible."""
+    keys = [_analysis_key(text) for text in texts]
+    with _analysis_cache_lock:
+        results = [_analysis_cache.get(key) for key in keys]
+
+    # Unique keys only, so identical articles in one response are analyzed once.
+    missing = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+    if not missing:
+        return results
+
+    _models_ready.wait()
+    if sentiment_pipeline is None:
+        raise ModelsUnavailableError(f"NLP models are not loaded: {_model_load_error!r}")
+    texts_by_key = dict(zip(keys, texts))
+    missing_texts = [texts_by_key[key] for key in missing]
+    sentiments = analyze_sentiments([text[:512] for text in missing_texts])
+    if nlp_ner:
+        docs = list(nlp_ner.pipe(missing_texts, batch_size=NER_BATCH_SIZE, n_process=1))
+    else:
+        docs = [None] * len(missing_texts)
+
+    analyzed = {}
+    with _analysis_cache_lock:
+        for key, sentiment_result, doc in zip(missing, sentiments, docs):
+            result = {'sentiment': sentiment_result, 'entities': extract_entities(doc)}
+            analyzed[key] = result
+            # Failed sentiment runs are not cached so they are retried on the next request.
+            if sentiment_result['label'] != 'UNKNOWN':
+                _analysis_cache[key] = result
+    return [result if result is not None else analyzed[key] for key, result in zip(keys, results)]
 
 def process_news_data(news_data):
     """Helper to process a list of articles and add NLP analysis."""
-    analyzed_articles = []
-    for i, article_data in enumerate(news_data):
-        content = article_data.get('content') or article_data.get('description') or ""
-        if not content: continue
-        analysis_results = perform_nlp_analysis(content)
-        analyzed_articles.append({
+    # Single pass over the articles: (id, title, content, published_at), empty content dropped.
+    raw = [(i, a.get('title'), a.get('content') or a.get('description') or "", a.get('publishedAt'))
+           for i, a in enumerate(news_data)]
+    raw = [r for r in raw if r[2]]
+
+    analyses = analyze_texts([r[2] for r in raw])
+
+    return [
+        {
             'id': i,
-            'title': article_data.get('title'),
+            'title': title,
             'content': content,
             # *** NEW: Added publication timestamp ***
-            'published_at': article_data.get('publishedAt'),
+            'published_at': published_at,
             'sentiment': analysis_results['sentiment'],
             'entities': analysis_results['entities']
-        })
-    return analyzed_articles
-
-@app.route('/api/analyze', methods=['GET'])
-@login_required
-def analyze_topic():
-    """API endpoint to fetch and analyze news for a given keyword."""
-    keyword = request.args.get('keyword', 'default topic')
-    
-    api_key = "Enter Your API Here"
-    lang_code = 'hi' if current_user.language == 'Hindi' else 'en'
-    api_url = f"https://newsapi.org/v2/everything?apiKey={api_key}&q={keyword}&language={lang_code}"
+        }
+        for (i, title, content, published_at), analysis_results in zip(raw, analyses)
+    ]
+
+# Shared HTTP session so TCP/TLS connections to the News API are reused across requests.
+SESSION = requests.Session()
+# Only a failed connect is retried (once, immediately): nothing was sent yet, and it
+# keeps the worst case inside NEWS_API_TIMEOUT.
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                                      max_retries=Retry(total=1, connect=1, read=0, status=0,
+                                                        other=0, backoff_factor=0)))
+
+# (connect, read) timeouts in seconds for News API calls. The read timeout applies
+# between bytes, so with the single connect retry a stalled upstream holds a worker
+# for at most about 5s.
+NEWS_API_TIMEOUT = (1, 3)
+
+def fetch_news(api_url):
+    """Helper to fetch a News API response as JSON."""
+    response = SESSION.get(api_url, timeout=NEWS_API_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+# Short-lived caches of already-analyzed News API results, so repeated queries
+# within the TTL skip both the upstream fetch and the NLP work.
+_news_cache = TTLCache(maxsize=512, ttl=90)
+_latest_news_cache = TTLCache(maxsize=1, ttl=30)
+_news_cache_lock = threading.Lock()
+
+def fetch_and_analyze(api_url, cache, cache_key):
+    """Helper to fetch articles from the News API and analyze them."""
+    with _news_cache_lock:
+        analyzed_articles = cache.get(cache_key)
+    if analyzed_articles is not None:
+        return jsonify(analyzed_articles)
 
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        response_data = response.json()
+        response_data = fetch_news(api_url)
 
         if response_data.get('status') != 'ok':
             error_message = response_data.get('message', 'Unknown API error')
             return jsonify({"error": f"News API Error: {error_message}"}), 400
-        
+
         news_data = response_data.get('articles', [])
         analyzed_articles = process_news_data(news_data)
+        # Like the analysis cache, skip responses with failed sentiment runs so they are retried.
+        if all(article['sentiment']['label'] != 'UNKNOWN' for article in analyzed_articles):
+            with _news_cache_lock:
+                cache[cache_key] = analyzed_articles
         return jsonify(analyzed_articles)
-        
+
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to the news service: {e}"}), 500
+    except ModelsUnavailableError as e:
+        return jsonify({"error": f"Analysis is temporarily unavailable: {e}"}), 503
     except Exception as e:
         return jsonify({"error": f"An internal server error occurred: {e}"}), 500
 
+@app.route('/api/analyze', methods=['GET'])
+@login_required
+def analyze_topic():
+    """API endpoint to fetch and analyze news for a given keyword."""
+    keyword = request.args.get('keyword', 'default topic')
+    
+    api_key = "Enter Your API Here"
+    lang_code = _LANG_MAP.get(current_user.language, 'en')
+    api_url = f"https://newsapi.org/v2/everything?apiKey={api_key}&q={keyword}&language={lang_code}"
+
+    return fetch_and_analyze(api_url, _news_cache, (keyword, lang_code))
+
 @app.route('/api/latest', methods=['GET'])
 @login_required
 def latest_news():
@@ -209,23 +490,15 @@ def latest_news():
     api_key = "Enter Your API Here"
     api_url = f"https://newsapi.org/v2/everything?apiKey={api_key}&q=news&language=en&sortBy=publishedAt"
 
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        response_data = response.json()
+    return fetch_and_analyze(api_url, _latest_news_cache, "__latest__")
 
-        if response_data.get('status') != 'ok':
-            error_message = response_data.get('message', 'Unknown API error')
-            return jsonify({"error": f"News API Error: {error_message}"}), 400
+# --- Database Initialization ---
 
-        news_data = response_data.get('articles', [])
-        analyzed_articles = process_news_data(news_data)
-        return jsonify(analyzed_articles)
-        
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Failed to connect to the news service: {e}"}), 500
-    except Exception as e:
-        return jsonify({"error": f"An internal server error occurred: {e}"}), 500
+@app.cli.command('init-db')
+def init_db():
+    """Creates the database tables. Run once before starting production workers."""
+    db.create_all()
+    print("Database initialized.")
 
 # --- Main Execution ---
 if __name__ == '__main__':
@@ -0,0 +1,18 @@
+# wsgi.py
+# Production entrypoint for a threaded WSGI server. Each request gets its own
+# worker thread, so a slow NewsAPI fetch or NLP pass only blocks that request.
+# SECRET_KEY must be set, and the tables are created once first so the workers
+# don't race on the schema:
+#
+#   export SECRET_KEY=...
+#   flask --app app init-db
+#   gunicorn -k gthread --threads 8 -w $(nproc) -b 0.0.0.0:8000 wsgi:app
+
+import os
+
+# The fallback key in app.py is public, so it would let anyone forge session
+# cookies. It is only for local development with python app.py.
+if not os.environ.get('SECRET_KEY'):
+    raise RuntimeError("SECRET_KEY environment variable must be set to run in production.")
+
+from app import app